@@ -5,6 +5,12 @@ import seaborn as sns
 import numpy as np
 from geopy.distance import geodesic
 import zipfile
+import hashlib
+import os
+import glob
+import shutil
+import json
+import tempfile
 from io import BytesIO
 
 # -----------------------------------------
@@ -34,35 +40,323 @@ Sube un archivo ZIP con los datos y explora la información de manera visual e i
 st.sidebar.image("./IMG/Mibici_logo.jpg")
 st.sidebar.title("⚙️ Configuración")
 uploaded_file = st.sidebar.file_uploader("📁 Sube el ZIP con los datos", type="zip")
+ruta_servidor = st.sidebar.text_input("🗂️ O indica un ZIP o carpeta con ZIPs dentro de la carpeta de datos del servidor")
 
 # -----------------------------------------
-# 🔹 Cargar nomenclatura de estaciones
+# 🔹 Registro de Estaciones (nomenclatura)
 # -----------------------------------------
 @st.cache_data
-def cargar_nomenclatura():
+def cargar_registro_estaciones():
+    """
+    Lee la nomenclatura una sola vez y la guarda como arreglos alineados por código de estación.
+    El código es la posición (0..N-1) del id en el arreglo ordenado de ids.
+    """
     try:
-        return pd.read_csv("./datos/Nomenclatura de las estaciones/nomenclatura_2025_01.csv", encoding='latin-1')
+        nomenclatura = pd.read_csv("./datos/Nomenclatura de las estaciones/nomenclatura_2025_01.csv", encoding='latin-1')
     except Exception as e:
         st.sidebar.error(f"⚠️ Error al cargar la nomenclatura: {e}")
         return None
 
-nomenclatura = cargar_nomenclatura()
+    nomenclatura = nomenclatura.drop_duplicates(subset="id").sort_values("id")
+    return {
+        "id": nomenclatura["id"].to_numpy(dtype=np.int32),
+        "name": nomenclatura["name"].to_numpy(dtype=object),
+        "obcn": nomenclatura["obcn"].to_numpy(dtype=object),
+        "location": nomenclatura["location"].to_numpy(dtype=object),
+        "status": nomenclatura["status"].to_numpy(dtype=object),
+        "lat": nomenclatura["latitude"].to_numpy(dtype=np.float64),
+        "lon": nomenclatura["longitude"].to_numpy(dtype=np.float64),
+    }
+
+def codificar_estaciones(registro, ids):
+    """Convierte ids de estación en códigos del registro (-1 si la estación no está registrada)."""
+    ids = np.asarray(ids)
+    posicion = np.clip(np.searchsorted(registro["id"], ids), 0, len(registro["id"]) - 1)
+    return np.where(registro["id"][posicion] == ids, posicion, -1).astype(np.int16)
+
+registro_estaciones = cargar_registro_estaciones()
+if registro_estaciones is None:
+    st.stop()
+
+# -----------------------------------------
+# 🧹 Validación y Limpieza de Viajes
+# -----------------------------------------
+DURACION_MAXIMA_MIN = 24 * 60
+AÑO_NACIMIENTO_MIN = 1920
+EDAD_MINIMA = 5
+
+def validar_viajes(df, registro):
+    """
+    Aplica todas las reglas de calidad de datos de forma vectorizada y devuelve el DataFrame limpio
+    junto con un reporte del número de filas que incumple cada regla (una fila puede incumplir varias).
+    Las estaciones se agregan como códigos del registro en "Origen Código" y "Destino Código".
+    """
+    inicio = df["Inicio del viaje"]
+    fin = df["Fin del viaje"]
+    duracion = (fin - inicio).dt.total_seconds() / 60
+    origen_codigo = codificar_estaciones(registro, df["Origen Id"].to_numpy())
+    destino_codigo = codificar_estaciones(registro, df["Destino Id"].to_numpy())
+
+    reglas = {
+        "Fechas no válidas": inicio.isna() | fin.isna(),
+        "Fin anterior o igual al inicio": duracion <= 0,
+        f"Duración mayor a {DURACION_MAXIMA_MIN} min": duracion > DURACION_MAXIMA_MIN,
+    }
+    # El año de nacimiento es opcional: sin la columna, la regla no se aplica
+    if "Año de nacimiento" in df.columns:
+        nacimiento = df["Año de nacimiento"]
+        reglas["Año de nacimiento no plausible"] = nacimiento.notna() & (
+            (nacimiento < AÑO_NACIMIENTO_MIN) | (nacimiento > inicio.dt.year - EDAD_MINIMA))
+    reglas["Estación no registrada"] = (origen_codigo < 0) | (destino_codigo < 0)
+    reglas["Viaje Id nulo"] = df["Viaje Id"].isna()
+    reglas["Viaje Id duplicado"] = df["Viaje Id"].notna() & df["Viaje Id"].duplicated(keep="first")
+
+    rechazados = np.zeros(len(df), dtype=bool)
+    for mascara in reglas.values():
+        rechazados |= np.asarray(mascara)
+
+    reporte = pd.DataFrame({
+        "Regla": list(reglas.keys()),
+        "Filas rechazadas": [int(mascara.sum()) for mascara in reglas.values()],
+    })
+
+    limpio = df.loc[~rechazados].copy()
+    limpio["Duración (min)"] = duracion[~rechazados].astype(np.float32)
+    limpio["Año"] = limpio["Inicio del viaje"].dt.year.astype(np.int16)
+    limpio["Mes"] = limpio["Inicio del viaje"].dt.month.astype(np.int8)
+    # Tipos fijos para que todas las partes del almacén tengan el mismo dtype
+    # (Usuario Id puede venir nulo, por eso se guarda como float64)
+    limpio["Viaje Id"] = limpio["Viaje Id"].astype(np.int64)
+    limpio["Usuario Id"] = limpio["Usuario Id"].astype(np.float64)
+    limpio["Origen Id"] = limpio["Origen Id"].astype(np.int32)
+    limpio["Destino Id"] = limpio["Destino Id"].astype(np.int32)
+    limpio["Origen Código"] = origen_codigo[~rechazados]
+    limpio["Destino Código"] = destino_codigo[~rechazados]
+    if "Año de nacimiento" in limpio.columns:
+        limpio["Año de nacimiento"] = limpio["Año de nacimiento"].astype(np.float32)
+    else:
+        limpio["Año de nacimiento"] = np.float32(np.nan)
+    limpio["Genero"] = limpio["Genero"].astype("category")
+
+    return limpio.reset_index(drop=True), reporte
+
+# -----------------------------------------
+# 📦 Fuentes de Datos ZIP (subida o ruta en el servidor)
+# -----------------------------------------
+# Solo se permiten rutas dentro de esta carpeta (configurable con MIBICI_DIRECTORIO_DATOS)
+DIRECTORIO_DATOS_SERVIDOR = os.path.realpath(os.environ.get("MIBICI_DIRECTORIO_DATOS", "./datos"))
+
+def listar_fuentes(archivo_subido, ruta):
+    """
+    Devuelve la lista de ZIPs a procesar: el archivo subido o los ZIPs de una ruta del servidor.
+    La ruta es relativa a DIRECTORIO_DATOS_SERVIDOR y no puede salir de esa carpeta.
+    """
+    if ruta:
+        ruta = os.path.realpath(os.path.join(DIRECTORIO_DATOS_SERVIDOR, ruta))
+        if os.path.commonpath([ruta, DIRECTORIO_DATOS_SERVIDOR]) != DIRECTORIO_DATOS_SERVIDOR:
+            st.sidebar.error("⚠️ La ruta debe estar dentro de la carpeta de datos del servidor.")
+            return []
+        if os.path.isdir(ruta):
+            return sorted(glob.glob(os.path.join(ruta, "*.zip")))
+        if os.path.isfile(ruta):
+            return [ruta]
+        st.sidebar.error("⚠️ La ruta indicada no existe en la carpeta de datos del servidor.")
+        return []
+    return [archivo_subido] if archivo_subido else []
+
+def calcular_huella(fuentes):
+    """
+    Calcula una huella barata del contenido a partir del directorio central de cada ZIP
+    (nombre, tamaño y CRC de cada CSV) sin descomprimir ni leer todos los bytes.
+    """
+    huella = hashlib.sha256()
+    for fuente in fuentes:
+        with zipfile.ZipFile(fuente, "r") as z:
+            for info in z.infolist():
+                if info.filename.endswith(".csv"):
+                    huella.update(f"{info.filename}|{info.file_size}|{info.CRC}\n".encode())
+        if hasattr(fuente, "seek"):
+            fuente.seek(0)
+    return huella.hexdigest()
+
+# -----------------------------------------
+# 🗄️ Almacén de Viajes Particionado por Año y Mes
+# -----------------------------------------
+DIRECTORIO_PARTICIONES = os.path.join(tempfile.gettempdir(), "mibici_particiones")
+COLUMNAS_ALMACEN = ["Viaje Id", "Usuario Id", "Genero", "Año de nacimiento", "Inicio del viaje",
+                    "Fin del viaje", "Origen Id", "Destino Id", "Origen Código", "Destino Código",
+                    "Duración (min)"]
+# Cambiar al modificar el formato de los archivos del almacén
+VERSION_ALMACEN = 3
+MAXIMO_ALMACENES = 3
+
+def clave_almacen(huella, registro):
+    """
+    Clave del almacén en disco: la huella de los ZIPs más todo lo que cambia su contenido
+    (ids del registro, que definen los códigos de estación, reglas de validación y formato).
+    """
+    clave = hashlib.sha256(huella.encode())
+    clave.update(registro["id"].tobytes())
+    clave.update(repr((VERSION_ALMACEN, COLUMNAS_ALMACEN, DURACION_MAXIMA_MIN,
+                       AÑO_NACIMIENTO_MIN, EDAD_MINIMA)).encode())
+    return clave.hexdigest()
+
+def limpiar_almacenes(conservar):
+    """
+    Borra los almacenes menos usados para que el directorio no crezca con cada carga distinta.
+    Las carpetas ocultas son construcciones en curso de otras sesiones y no se tocan.
+    """
+    almacenes = []
+    for nombre in os.listdir(DIRECTORIO_PARTICIONES):
+        ruta = os.path.join(DIRECTORIO_PARTICIONES, nombre)
+        if nombre.startswith(".") or ruta == conservar:
+            continue
+        try:
+            almacenes.append((os.path.getmtime(ruta), ruta))
+        except OSError:
+            continue  # Otra sesión lo borró mientras se listaba
+    for _, almacen in sorted(almacenes, reverse=True)[MAXIMO_ALMACENES - 1:]:
+        shutil.rmtree(almacen, ignore_errors=True)
+
+def escribir_particiones(df, raiz, parte, categorias_genero, particiones):
+    """
+    Escribe un DataFrame validado como un archivo .npy por columna en `raiz/<año>/<mes>/<parte>/`.
+    Genero se guarda como códigos int8 de `categorias_genero`; Año y Mes quedan implícitos en la ruta.
+    Devuelve las carpetas escritas como tuplas (año, mes, carpeta).
+    """
+    carpetas = []
+    genero = df["Genero"].astype(object)
+    for valor in genero.dropna().unique():
+        if valor not in categorias_genero:
+            categorias_genero.append(valor)
+
+    for (año, mes), grupo in df.groupby(["Año", "Mes"]):
+        carpeta = os.path.join(raiz, str(año), f"{mes:02d}", str(parte))
+        os.makedirs(carpeta)
+        for col in COLUMNAS_ALMACEN:
+            if col == "Genero":
+                valores = pd.Categorical(genero.loc[grupo.index], categories=categorias_genero).codes.astype(np.int8)
+            else:
+                valores = grupo[col].to_numpy()
+            np.save(os.path.join(carpeta, f"{col}.npy"), valores)
+
+        meses = particiones.setdefault(str(año), {})
+        meses[f"{mes:02d}"] = meses.get(f"{mes:02d}", 0) + len(grupo)
+        carpetas.append((str(año), f"{mes:02d}", carpeta))
+
+    return carpetas
+
+def eliminar_duplicados_entre_archivos(carpetas, particiones):
+    """
+    Quita los Viaje Id repetidos entre archivos con un solo pase global sobre el almacén
+    (se conserva la primera aparición) y devuelve cuántas filas se eliminaron.
+    Solo se reescriben las partes que tenían duplicados.
+    """
+    ids = [cargar_columna(carpeta, "Viaje Id") for _, _, carpeta in carpetas]
+    longitudes = [len(ids_parte) for ids_parte in ids]
+    duplicados = pd.Series(np.concatenate(ids) if ids else []).duplicated(keep="first").to_numpy()
+    del ids
+
+    inicio = 0
+    for (año, mes, carpeta), longitud in zip(carpetas, longitudes):
+        mascara = duplicados[inicio:inicio + longitud]
+        inicio += longitud
+        if not mascara.any():
+            continue
+        for col in COLUMNAS_ALMACEN:
+            ruta = os.path.join(carpeta, f"{col}.npy")
+            np.save(ruta, np.load(ruta)[~mascara])
+        particiones[año][mes] -= int(mascara.sum())
+
+    return int(duplicados.sum())
+
+def cargar_columna(carpeta, col):
+    """Abre una columna de una parte del almacén como arreglo memory-mapped (sin copiarla a memoria)."""
+    return np.load(os.path.join(carpeta, f"{col}.npy"), mmap_mode="r")
+
+def leer_particiones(raiz, metadatos, columnas, años=None, meses=(1, 12), codigos_estacion=None):
+    """
+    Lee solo las particiones y columnas pedidas a partir de los archivos memory-mapped.
+    - `años`: lista de años (None = todos); `meses`: rango inclusivo de meses.
+    - `codigos_estacion`: códigos del registro; se conservan los viajes que inician o terminan en ellos.
+    """
+    columnas_fisicas = [col for col in columnas if col not in ("Año", "Mes")]
+    partes = {col: [] for col in columnas}
+
+    for año in sorted(metadatos["particiones"]):
+        if años is not None and int(año) not in años:
+            continue
+        for mes in sorted(metadatos["particiones"][año]):
+            if not meses[0] <= int(mes) <= meses[1]:
+                continue
+            carpeta_mes = os.path.join(raiz, año, mes)
+            for parte in sorted(os.listdir(carpeta_mes), key=int):
+                carpeta = os.path.join(carpeta_mes, parte)
+
+                if codigos_estacion is not None:
+                    mascara = (np.isin(cargar_columna(carpeta, "Origen Código"), codigos_estacion)
+                               | np.isin(cargar_columna(carpeta, "Destino Código"), codigos_estacion))
+                    n = int(mascara.sum())
+                else:
+                    mascara = slice(None)
+                    n = len(cargar_columna(carpeta, "Duración (min)"))
+
+                for col in columnas_fisicas:
+                    partes[col].append(np.asarray(cargar_columna(carpeta, col)[mascara]))
+                if "Año" in partes:
+                    partes["Año"].append(np.full(n, int(año), dtype=np.int16))
+                if "Mes" in partes:
+                    partes["Mes"].append(np.full(n, int(mes), dtype=np.int8))
+
+    df = pd.DataFrame({col: np.concatenate(valores) for col, valores in partes.items() if valores})
+    if "Genero" in df.columns:
+        df["Genero"] = pd.Categorical.from_codes(df["Genero"], metadatos["categorias_genero"])
+    return df
 
 # -----------------------------------------
 # 🔹 Función para Cargar y Procesar Datos ZIP
 # -----------------------------------------
-@st.cache_data
-def cargar_datos_zip(zip_file):
-    """Carga y procesa los archivos CSV dentro del ZIP."""
-    dfs_por_año = {}
-    
+def leer_csv_zip(z, archivo):
+    """
+    Lee un CSV del ZIP descomprimiéndolo en flujo hacia el parser.
+    Se intenta UTF-8 y, si el archivo no lo es, latin-1 (los datos abiertos usan ambas codificaciones).
+    """
+    try:
+        with z.open(archivo) as f:
+            return pd.read_csv(f, encoding='utf-8')
+    except UnicodeDecodeError:
+        with z.open(archivo) as f:
+            return pd.read_csv(f, encoding='latin-1')
+
+def cargar_datos_zip(fuentes, clave):
+    """
+    Carga los CSV de los ZIPs uno por uno, los valida y los escribe en el almacén particionado.
+    Si el almacén de esta clave ya existe en disco, se reutiliza sin volver a leer los ZIPs;
+    la comprobación se hace en cada ejecución, así que un almacén borrado se reconstruye.
+    El almacén se construye en una carpeta temporal y se publica con un solo os.rename, de modo
+    que otras sesiones nunca ven (ni borran) un almacén a medio escribir.
+    """
+    raiz = os.path.join(DIRECTORIO_PARTICIONES, clave)
+    ruta_metadatos = os.path.join(raiz, "metadatos.json")
+    if os.path.exists(ruta_metadatos):
+        os.utime(raiz)
+        with open(ruta_metadatos, encoding="utf-8") as f:
+            return raiz, json.load(f)
+
+    os.makedirs(DIRECTORIO_PARTICIONES, exist_ok=True)
+    construccion = tempfile.mkdtemp(prefix=".construyendo-", dir=DIRECTORIO_PARTICIONES)
+    registro = cargar_registro_estaciones()
+    categorias_genero, particiones, reportes = [], {}, []
+    carpetas = []
+    parte = 0
+
     try:
-        with zipfile.ZipFile(zip_file, "r") as z:
-            archivos_csv = [f for f in z.namelist() if f.endswith(".csv")]
+        for fuente in fuentes:
+            with zipfile.ZipFile(fuente, "r") as z:
+                archivos_csv = [f for f in z.namelist() if f.endswith(".csv")]
 
-            for archivo in archivos_csv:
-                with z.open(archivo) as f:
-                    df = pd.read_csv(f, encoding='latin-1')
+                for archivo in archivos_csv:
+                    df = leer_csv_zip(z, archivo)
 
                     # Renombrar columnas
                     df.rename(columns={
@@ -75,51 +369,117 @@ def cargar_datos_zip(zip_file):
                         'Viaje_Id': 'Viaje Id'
                     }, inplace=True)
 
-                    # Convertir fechas y extraer Año y Mes
+                    # Convertir fechas
                     df["Inicio del viaje"] = pd.to_datetime(df["Inicio del viaje"], errors="coerce")
                     df["Fin del viaje"] = pd.to_datetime(df["Fin del viaje"], errors="coerce")
-                    df["Año"] = df["Inicio del viaje"].dt.year
-                    df["Mes"] = df["Inicio del viaje"].dt.month
-
-                    # Extraer el año desde el nombre del archivo
-                    año = archivo.split("_")[1][:4]
-                    dfs_por_año[año] = df
 
-        global_df = pd.concat(dfs_por_año.values(), ignore_index=True)
-        return dfs_por_año, global_df
+                    # Validar y escribir particiones
+                    df, reporte = validar_viajes(df, registro)
+                    carpetas += escribir_particiones(df, construccion, parte, categorias_genero, particiones)
+                    reportes.append(reporte)
+                    parte += 1
+
+        reporte = pd.concat(reportes).groupby("Regla", sort=False)["Filas rechazadas"].sum()
+        # Los duplicados entre archivos se detectan una sola vez al final
+        reporte["Viaje Id duplicado"] += eliminar_duplicados_entre_archivos(carpetas, particiones)
+        metadatos = {
+            "particiones": particiones,
+            "categorias_genero": categorias_genero,
+            "reporte": {regla: int(filas) for regla, filas in reporte.items()},
+        }
+        with open(os.path.join(construccion, "metadatos.json"), "w", encoding="utf-8") as f:
+            json.dump(metadatos, f, ensure_ascii=False)
 
     except Exception as e:
+        shutil.rmtree(construccion, ignore_errors=True)
         st.error(f"⚠️ Error al procesar el archivo ZIP: {e}")
         return None, None
 
+    try:
+        os.rename(construccion, raiz)
+    except OSError:
+        # Otra sesión publicó el mismo almacén primero: se usa el suyo
+        shutil.rmtree(construccion, ignore_errors=True)
+        with open(ruta_metadatos, encoding="utf-8") as f:
+            metadatos = json.load(f)
+
+    limpiar_almacenes(raiz)
+    return raiz, metadatos
+
 # -----------------------------------------
 # 🔹 Cargar Datos desde ZIP
 # -----------------------------------------
-if uploaded_file:
-    dfs_por_año, global_df = cargar_datos_zip(uploaded_file)
-    if global_df is not None:
+fuentes = listar_fuentes(uploaded_file, ruta_servidor)
+if fuentes:
+    try:
+        huella_datos = calcular_huella(fuentes)
+    except zipfile.BadZipFile as e:
+        st.sidebar.error(f"⚠️ Archivo ZIP no válido: {e}")
+        st.stop()
+
+    clave_datos = clave_almacen(huella_datos, registro_estaciones)
+    raiz_particiones, metadatos = cargar_datos_zip(fuentes, clave_datos)
+    if metadatos is None:
+        st.sidebar.error("⚠️ No se pudieron cargar los datos.")
+        st.stop()
+
+    total_validos = sum(sum(meses.values()) for meses in metadatos["particiones"].values())
+    if total_validos > 0:
         st.sidebar.success("✅ Datos cargados correctamente.")
     else:
-        st.sidebar.error("⚠️ No se pudieron cargar los datos.")
+        st.sidebar.error("⚠️ Ningún viaje pasó la validación; revisa el reporte.")
+    with st.sidebar.expander("🧹 Reporte de validación", expanded=total_validos == 0):
+        st.dataframe(pd.DataFrame({"Regla": list(metadatos["reporte"].keys()),
+                                   "Filas rechazadas": list(metadatos["reporte"].values())}), hide_index=True)
+        st.write(f"✅ **Viajes válidos:** {total_validos:,}")
+    if total_validos == 0:
         st.stop()
 else:
-    st.sidebar.warning("⚠️ Carga un archivo ZIP para continuar.")
+    st.sidebar.warning("⚠️ Carga un archivo ZIP o indica una ruta para continuar.")
     st.stop()
 
 # -----------------------------------------
-# 🔹 Sidebar: Selección de Año
+# 🔹 Sidebar: Filtros (Año, Meses y Estaciones)
 # -----------------------------------------
-opciones_año = ["Global"] + sorted(dfs_por_año.keys())
+opciones_año = ["Global"] + sorted(metadatos["particiones"].keys())
 seleccion_año = st.sidebar.selectbox("📆 Selecciona un Año", opciones_año)
+rango_meses = st.sidebar.slider("🗓️ Rango de Meses", 1, 12, (1, 12))
+seleccion_estaciones = st.sidebar.multiselect(
+    "📍 Filtrar por Estaciones (origen o destino)",
+    range(len(registro_estaciones["id"])),
+    format_func=lambda codigo: registro_estaciones["name"][codigo],
+)
 
-df_seleccionado = global_df if seleccion_año == "Global" else dfs_por_año[seleccion_año]
+def leer_seleccion(columnas, año, meses, estaciones):
+    """
+    Lee del almacén solo las columnas pedidas para un año ("Global" = todos), rango de meses y estaciones.
+    Si otra sesión borró el almacén mientras se usaba, se vuelve a ejecutar la app para reconstruirlo.
+    """
+    try:
+        return leer_particiones(
+            raiz_particiones, metadatos, columnas,
+            años=None if año == "Global" else [int(año)],
+            meses=meses,
+            codigos_estacion=np.array(estaciones, dtype=np.int16) if estaciones else None,
+        )
+    except FileNotFoundError:
+        st.warning("⚠️ El almacén de datos fue reemplazado; se volverá a cargar.")
+        st.rerun()
+
+def cargar_seleccion(columnas):
+    """Lee del almacén solo las columnas pedidas, respetando los filtros del sidebar."""
+    return leer_seleccion(columnas, seleccion_año, rango_meses, seleccion_estaciones)
+
+if len(cargar_seleccion(["Año"])) == 0:
+    st.warning("⚠️ No hay viajes para los filtros seleccionados.")
+    st.stop()
 
 # -----------------------------------------
 # 📊 Número de Viajes por Mes y Año
 # -----------------------------------------
 st.subheader("📊 Número de Viajes por Mes y Año")
 
-viajes_mensuales = df_seleccionado.groupby(["Año", "Mes"]).size().reset_index(name="Total de Viajes")
+viajes_mensuales = cargar_seleccion(["Año", "Mes"]).groupby(["Año", "Mes"]).size().reset_index(name="Total de Viajes")
 
 fig, ax = plt.subplots(figsize=(14, 6))
 sns.lineplot(data=viajes_mensuales, x="Mes", y="Total de Viajes", hue="Año", palette="tab10", marker="o", ax=ax)
@@ -138,7 +498,7 @@ st.text("📌 Este gráfico muestra la evolución mensual del número de viajes
 # -----------------------------------------
 st.subheader("🚴‍♂️ Top 10 Estaciones con Más Viajes")
 
-viajes_origen = df_seleccionado["Origen Id"].value_counts().head(10).reset_index()
+viajes_origen = cargar_seleccion(["Origen Id"])["Origen Id"].value_counts().head(10).reset_index()
 viajes_origen.columns = ["Estación", "Viajes"]
 
 fig, ax = plt.subplots(figsize=(12, 6))
@@ -175,7 +535,7 @@ def calcular_promedio_viajes(df, group_col, value_name="Total de Viajes"):
 # -----------------------------------------
 st.subheader("📌 Promedio de Viajes por Estación")
 
-viajes_por_estacion, promedio_viajes_estacion = calcular_promedio_viajes(global_df, "Origen Id")
+viajes_por_estacion, promedio_viajes_estacion = calcular_promedio_viajes(cargar_seleccion(["Origen Id"]), "Origen Id")
 
 if viajes_por_estacion is not None:
     st.write(f"📊 **Promedio de viajes por estación:** {promedio_viajes_estacion:.2f} viajes")
@@ -205,7 +565,7 @@ if viajes_por_estacion is not None:
 # -----------------------------------------
 st.subheader("📆 Promedio de Viajes por Año")
 
-viajes_por_año, promedio_viajes_año = calcular_promedio_viajes(global_df, "Año")
+viajes_por_año, promedio_viajes_año = calcular_promedio_viajes(cargar_seleccion(["Año"]), "Año")
 
 if viajes_por_año is not None:
     st.write(f"📊 **Promedio de viajes por año:** {promedio_viajes_año:.2f} viajes")
@@ -249,23 +609,16 @@ def calcular_distancia(row):
 
 st.subheader("📏 **Aproximación de Distancia Recorrida**")
 
-df_distancia = global_df.copy()
-
-# 🔹 **Validar y Calcular Duración si no existe**
-if "Duración (min)" not in df_distancia.columns:
-    df_distancia["Inicio del viaje"] = pd.to_datetime(df_distancia["Inicio del viaje"], errors="coerce")
-    df_distancia["Fin del viaje"] = pd.to_datetime(df_distancia["Fin del viaje"], errors="coerce")
-    df_distancia["Duración (min)"] = (df_distancia["Fin del viaje"] - df_distancia["Inicio del viaje"]).dt.total_seconds() / 60
-
-# 🔹 **Cargar y unir coordenadas de la nomenclatura**
-nomenclatura = pd.read_csv("./datos/Nomenclatura de las estaciones/nomenclatura_2025_01.csv", encoding='latin-1')
-nomenclatura = nomenclatura.rename(columns={"id": "Estación", "latitude": "lat", "longitude": "lon"})
+df_distancia = cargar_seleccion(["Origen Id", "Destino Id", "Duración (min)", "Genero",
+                                 "Origen Código", "Destino Código"])
 
-df_distancia = df_distancia.merge(nomenclatura[['Estación', 'lat', 'lon']], left_on="Origen Id", right_on="Estación", how="left")
-df_distancia = df_distancia.rename(columns={"lat": "lat_origin", "lon": "lon_origin"}).drop(columns=["Estación"])
-
-df_distancia = df_distancia.merge(nomenclatura[['Estación', 'lat', 'lon']], left_on="Destino Id", right_on="Estación", how="left")
-df_distancia = df_distancia.rename(columns={"lat": "lat_destination", "lon": "lon_destination"}).drop(columns=["Estación"])
+# 🔹 **Obtener coordenadas del registro de estaciones por código**
+origen_codigo = df_distancia.pop("Origen Código").to_numpy()
+destino_codigo = df_distancia.pop("Destino Código").to_numpy()
+df_distancia["lat_origin"] = registro_estaciones["lat"][origen_codigo]
+df_distancia["lon_origin"] = registro_estaciones["lon"][origen_codigo]
+df_distancia["lat_destination"] = registro_estaciones["lat"][destino_codigo]
+df_distancia["lon_destination"] = registro_estaciones["lon"][destino_codigo]
 
 # 🔹 **Aplicar función de cálculo de distancia**
 df_distancia["Distancia (km)"] = df_distancia.apply(calcular_distancia, axis=1)
@@ -330,15 +683,13 @@ st.text("⏳ Esta sección analiza la duración de los viajes en función del g
 # 📊 Función para calcular los viajes por día de la semana
 # -----------------------------------------
 def calcular_viajes_por_dia(df):
-    """Convierte fechas, obtiene días de la semana y cuenta viajes."""
-    df["Inicio del viaje"] = pd.to_datetime(df["Inicio del viaje"], errors="coerce")
-    df["Día de la Semana"] = df["Inicio del viaje"].dt.dayofweek
+    """Obtiene días de la semana y cuenta viajes."""
     dias_semana = {0: "Lunes", 1: "Martes", 2: "Miércoles", 3: "Jueves", 
                    4: "Viernes", 5: "Sábado", 6: "Domingo"}
-    df["Día de la Semana"] = df["Día de la Semana"].map(dias_semana)
+    dia_semana = df["Inicio del viaje"].dt.dayofweek.map(dias_semana)
     
     # Contar viajes por día de la semana
-    viajes_por_dia = df["Día de la Semana"].value_counts().reindex(dias_semana.values()).reset_index()
+    viajes_por_dia = dia_semana.value_counts().reindex(dias_semana.values()).reset_index()
     viajes_por_dia.columns = ["Día de la Semana", "Número de Viajes"]
     
     return viajes_por_dia
@@ -348,7 +699,7 @@ def calcular_viajes_por_dia(df):
 # -----------------------------------------
 st.subheader("📅 **Uso de Mibici por Día de la Semana**")
 
-viajes_por_dia = calcular_viajes_por_dia(global_df)
+viajes_por_dia = calcular_viajes_por_dia(cargar_seleccion(["Inicio del viaje"]))
 
 # 🔹 **Gráfico de Barras: Número de Viajes por Día**
 fig1, ax1 = plt.subplots(figsize=(10, 5))
@@ -375,6 +726,69 @@ st.text("📅 Este análisis examina el uso de Mibici según el día de la seman
         "de demanda, como días con mayor actividad o posibles variaciones en el uso del sistema. 🚴‍♂️📊")
 
 
+# -----------------------------------------
+# 🕒 Núcleo de Agregación por Hora del Día
+# -----------------------------------------
+def agregar_por_hora(inicio, grupo=None, num_grupos=7, pesos=None):
+    """
+    Cuenta (o suma `pesos`) por grupo × hora del día con un solo np.bincount.
+    Hora y día de la semana se obtienen de la representación int64 de datetime64, sin accesores .dt.
+    - `grupo`: códigos enteros 0..num_grupos-1 (por defecto, día de la semana con 0=Lunes).
+    Devuelve una matriz de forma (num_grupos, 24).
+    """
+    segundos = np.asarray(inicio).astype("datetime64[s]").astype(np.int64)
+    hora = (segundos // 3600) % 24
+    if grupo is None:
+        # El 1970-01-01 fue jueves (3 con 0=Lunes)
+        grupo = (segundos // 86400 + 3) % 7
+        num_grupos = 7
+    indice = np.asarray(grupo, dtype=np.int64) * 24 + hora
+    return np.bincount(indice, weights=pesos, minlength=num_grupos * 24).reshape(num_grupos, 24)
+
+# -----------------------------------------
+# 🕒 Mapas de Calor de Demanda por Hora
+# -----------------------------------------
+st.subheader("🕒 **Demanda por Hora del Día**")
+
+metrica_hora = st.sidebar.radio("📐 Métrica de los mapas de calor", ["Número de Viajes", "Minutos de Uso"])
+df_horas = cargar_seleccion(["Inicio del viaje", "Origen Código", "Duración (min)"])
+inicio_horas = df_horas["Inicio del viaje"].to_numpy()
+pesos_horas = df_horas["Duración (min)"].to_numpy(dtype=np.float64) if metrica_hora == "Minutos de Uso" else None
+
+# 🔹 **Hora × Día de la Semana**
+matriz_dia = agregar_por_hora(inicio_horas, pesos=pesos_horas)
+
+fig, ax = plt.subplots(figsize=(14, 5))
+sns.heatmap(matriz_dia, cmap="YlOrRd", ax=ax,
+            yticklabels=["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"])
+ax.set_xlabel("Hora del Día", fontsize=12)
+ax.set_ylabel("Día de la Semana", fontsize=12)
+ax.set_title(f"{metrica_hora} por Hora y Día de la Semana", fontsize=14)
+plt.tight_layout()
+st.pyplot(fig)
+
+# 🔹 **Hora × Estación (Top 20 estaciones de origen)**
+num_estaciones = len(registro_estaciones["id"])
+matriz_estacion = agregar_por_hora(inicio_horas, df_horas["Origen Código"].to_numpy(),
+                                   num_estaciones, pesos=pesos_horas)
+total_estacion = matriz_estacion.sum(axis=1)
+con_uso = np.flatnonzero(total_estacion > 0)
+top_codigos = con_uso[np.argsort(total_estacion[con_uso])[::-1][:20]]
+
+fig, ax = plt.subplots(figsize=(14, 8))
+sns.heatmap(matriz_estacion[top_codigos], cmap="YlGnBu", ax=ax,
+            yticklabels=registro_estaciones["name"][top_codigos])
+ax.set_xlabel("Hora del Día", fontsize=12)
+ax.set_ylabel("Estación de Origen", fontsize=12)
+ax.set_title(f"{metrica_hora} por Hora y Estación", fontsize=14)
+plt.tight_layout()
+st.pyplot(fig)
+st.text("🕒 Esta sección muestra cómo se distribuye la demanda de Mibici a lo largo del día. "
+        "El primer mapa de calor cruza la hora de inicio del viaje con el día de la semana y el segundo "
+        "con las 20 estaciones de origen más utilizadas. Se puede elegir entre contar viajes o sumar los "
+        "minutos de uso, lo que permite identificar horas pico y estaciones con mayor carga. 🚴‍♂️🔥")
+
+
 # -----------------------------------------
 # 💰 Función para Calcular el Costo de los Viajes
 # -----------------------------------------
@@ -398,21 +812,8 @@ def calcular_costo(duracion):
 # -----------------------------------------
 st.subheader("💰 **Total de Dinero Gastado (Aproximado)**")
 
-# 🔹 **Verificar si la columna "Duración (min)" existe**
-if "Duración (min)" not in global_df.columns:
-    
-    # Convertir a datetime
-    global_df["Inicio del viaje"] = pd.to_datetime(global_df["Inicio del viaje"], errors="coerce")
-    global_df["Fin del viaje"] = pd.to_datetime(global_df["Fin del viaje"], errors="coerce")
-    
-    # Calcular la duración en minutos
-    global_df["Duración (min)"] = (global_df["Fin del viaje"] - global_df["Inicio del viaje"]).dt.total_seconds() / 60
-    
-    # Eliminar valores negativos o nulos
-    global_df = global_df[global_df["Duración (min)"] > 0]
-
 # 🔹 **Aplicar la función de costos**
-df_costos = global_df.copy()
+df_costos = cargar_seleccion(["Viaje Id", "Duración (min)"])
 df_costos["Costo (MXN)"] = df_costos["Duración (min)"].apply(calcular_costo)
 
 # 🔹 **Mostrar los primeros 10 registros**
@@ -441,15 +842,6 @@ st.text("💰 Este análisis estima el gasto total generado por los usuarios de
 
 st.subheader("📊 Uso de Estaciones (Mes - Año - Inicio - Fin)")
 
-# 🔹 **Verificar si la columna 'Inicio del viaje' existe y convertirla a datetime si es necesario**
-if "Inicio del viaje" not in global_df.columns:
-    st.error("⚠️ ERROR: La columna 'Inicio del viaje' no existe. Se procederá a calcularla nuevamente.")
-    global_df["Inicio del viaje"] = pd.to_datetime(global_df["Inicio del viaje"], errors="coerce")
-
-# 🔹 **Crear columnas adicionales para análisis**
-global_df["Mes"] = global_df["Inicio del viaje"].dt.month
-global_df["Año"] = global_df["Inicio del viaje"].dt.year
-
 # 🔹 **Definir opciones de análisis en el Sidebar**
 st.sidebar.markdown("---")
 tipo_grafico = st.sidebar.selectbox(
@@ -484,7 +876,11 @@ if tipo_grafico in graficos:
     st.subheader(f"📅 {config['titulo']}")
 
     # 🔹 **Conteo de viajes por la columna seleccionada**
-    df_agrupado = global_df[config["col"]].value_counts().sort_index().reset_index()
+    conteo = cargar_seleccion([config["col"]])[config["col"]].value_counts().sort_index()
+    if config["col"] == "Mes":
+        # Todos los meses del rango seleccionado, aunque no tengan viajes
+        conteo = conteo.reindex(range(rango_meses[0], rango_meses[1] + 1), fill_value=0)
+    df_agrupado = conteo.reset_index()
     df_agrupado.columns = [config["col"], "Total de Viajes"]
 
     # 🔹 **Generar el gráfico según el tipo**
@@ -500,7 +896,9 @@ if tipo_grafico in graficos:
     ax.set_title(config["titulo"], fontsize=14)
     
     if config["xticks"]:
-        plt.xticks(range(len(config["xticks"])), config["xticks"], rotation=45)
+        # Etiquetas tomadas de los valores de Mes presentes (1 = "Ene")
+        plt.xticks(range(len(df_agrupado)), [config["xticks"][mes - 1] for mes in df_agrupado[config["col"]]],
+                   rotation=45)
     
     plt.tight_layout()
     st.pyplot(fig)
@@ -509,15 +907,14 @@ if tipo_grafico in graficos:
 elif tipo_grafico == "Comparación Inicio vs Fin":
     st.subheader("🚴 Comparación de Uso: Estaciones de Inicio vs Fin")
 
-    # 🔹 **Obtener conteos de viajes desde y hacia estaciones**
-    viajes_inicio = global_df["Origen Id"].value_counts().reset_index()
-    viajes_inicio.columns = ["Estación", "Viajes Inicio"]
-
-    viajes_fin = global_df["Destino Id"].value_counts().reset_index()
-    viajes_fin.columns = ["Estación", "Viajes Fin"]
-
-    # 🔹 **Unir ambos DataFrames**
-    uso_estaciones = viajes_inicio.merge(viajes_fin, on="Estación", how="outer").fillna(0)
+    # 🔹 **Conteos de viajes desde y hacia estaciones por código del registro**
+    num_estaciones = len(registro_estaciones["id"])
+    df_codigos = cargar_seleccion(["Origen Código", "Destino Código"])
+    uso_estaciones = pd.DataFrame({
+        "Estación": registro_estaciones["id"],
+        "Viajes Inicio": np.bincount(df_codigos["Origen Código"], minlength=num_estaciones),
+        "Viajes Fin": np.bincount(df_codigos["Destino Código"], minlength=num_estaciones),
+    })
 
     # 🔹 **Seleccionar las 10 estaciones más utilizadas**
     top_estaciones = uso_estaciones.sort_values(by=["Viajes Inicio", "Viajes Fin"], ascending=False).head(10)
@@ -546,40 +943,170 @@ elif tipo_grafico == "Comparación Inicio vs Fin":
 # -----------------------------------------
 st.subheader("📊 **Correlación entre Día de la Semana y Tiempo de Viaje**")
 
-# 🔹 **Verificar si las columnas necesarias existen**
-if "Inicio del viaje" in global_df.columns and "Duración (min)" in global_df.columns:
-    
-    # 🔹 **Convertir a datetime si es necesario**
-    global_df["Inicio del viaje"] = pd.to_datetime(global_df["Inicio del viaje"], errors="coerce")
+# 🔹 **Extraer el día de la semana (0=Lunes, 6=Domingo)**
+df_dia_tiempo = cargar_seleccion(["Inicio del viaje", "Duración (min)"])
+df_dia_tiempo["Día de la Semana"] = df_dia_tiempo["Inicio del viaje"].dt.dayofweek
 
-    # 🔹 **Extraer el día de la semana (0=Lunes, 6=Domingo)**
-    df_dia_tiempo = global_df[["Inicio del viaje", "Duración (min)"]].dropna().copy()
-    df_dia_tiempo["Día de la Semana"] = df_dia_tiempo["Inicio del viaje"].dt.dayofweek
+# 🔹 **Mapeo de números a nombres de días**
+dias_semana = {0: "Lunes", 1: "Martes", 2: "Miércoles", 3: "Jueves", 4: "Viernes", 5: "Sábado", 6: "Domingo"}
+df_dia_tiempo["Día de la Semana Nombre"] = df_dia_tiempo["Día de la Semana"].map(dias_semana)
 
-    # 🔹 **Mapeo de números a nombres de días**
-    dias_semana = {0: "Lunes", 1: "Martes", 2: "Miércoles", 3: "Jueves", 4: "Viernes", 5: "Sábado", 6: "Domingo"}
-    df_dia_tiempo["Día de la Semana Nombre"] = df_dia_tiempo["Día de la Semana"].map(dias_semana)
+# 🔹 **Cálculo de la correlación**
+correlacion = df_dia_tiempo["Día de la Semana"].corr(df_dia_tiempo["Duración (min)"])
 
-    # 🔹 **Cálculo de la correlación**
-    correlacion = df_dia_tiempo["Día de la Semana"].corr(df_dia_tiempo["Duración (min)"])
+st.write(f"🔢 **Coeficiente de Correlación Pearson:** {correlacion:.3f}")
 
-    st.write(f"🔢 **Coeficiente de Correlación Pearson:** {correlacion:.3f}")
+# 🔹 **Gráfico de Boxplot (Distribución del tiempo de viaje por día)**
+fig, ax = plt.subplots(figsize=(10, 5))
+sns.boxplot(data=df_dia_tiempo, x="Día de la Semana Nombre", y="Duración (min)", palette="coolwarm", ax=ax)
 
-    # 🔹 **Gráfico de Boxplot (Distribución del tiempo de viaje por día)**
-    fig, ax = plt.subplots(figsize=(10, 5))
-    sns.boxplot(data=df_dia_tiempo, x="Día de la Semana Nombre", y="Duración (min)", palette="coolwarm", ax=ax)
-    
-    ax.set_xlabel("Día de la Semana", fontsize=12)
-    ax.set_ylabel("Duración del Viaje (min)", fontsize=12)
-    ax.set_title("📉 Relación entre Día de la Semana y Tiempo de Viaje", fontsize=14)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
+ax.set_xlabel("Día de la Semana", fontsize=12)
+ax.set_ylabel("Duración del Viaje (min)", fontsize=12)
+ax.set_title("📉 Relación entre Día de la Semana y Tiempo de Viaje", fontsize=14)
+plt.xticks(rotation=45)
+plt.tight_layout()
+st.pyplot(fig)
+st.text("📊 Este análisis examina la relación entre el día de la semana y la duración de los viajes en Mibici. "
+    "Se calcula el coeficiente de correlación de Pearson para evaluar si existe una tendencia en la duración "
+    "de los viajes según el día. Además, se presenta un gráfico de caja (boxplot) para visualizar la distribución "
+    "de los tiempos de viaje en cada día de la semana, permitiendo identificar patrones o diferencias significativas "
+    "en el uso de Mibici a lo largo de la semana. 🚴‍♂️📅")
+
+# -----------------------------------------
+# 👤 Motor de Sesionización por Usuario
+# -----------------------------------------
+COHORTES_EDAD = [0, 18, 25, 35, 45, 55, 65, np.inf]
+ETIQUETAS_COHORTE = ["<18", "18-24", "25-34", "35-44", "45-54", "55-64", "65+"]
+
+def sesionizar_usuarios(df, ventana_min=30):
+    """
+    Calcula métricas por usuario ordenando una sola vez por (usuario, inicio del viaje).
+    - Viajes encadenados: el origen coincide con el destino del viaje anterior del mismo
+      usuario y el nuevo viaje inicia a lo más `ventana_min` minutos después.
+    - Devuelve arreglos compactos alineados por usuario y el número de viajes por cohorte de edad.
+    Cada columna se lee sin copia y se reordena una sola vez.
+    """
+    usuarios = df["Usuario Id"].to_numpy()
+    inicio = df["Inicio del viaje"].to_numpy()
+    unidad, _ = np.datetime_data(inicio.dtype)
+    por_segundo = np.timedelta64(1, "s") // np.timedelta64(1, unidad)
+
+    # 🔹 **Un solo ordenamiento por (usuario, inicio); los usuarios nulos quedan al final y se descartan**
+    orden = np.lexsort((inicio, usuarios))
+    if usuarios.dtype.kind == "f":
+        orden = orden[:len(orden) - int(np.isnan(usuarios).sum())]
+    n = len(orden)
+
+    if n == 0:
+        vacio = np.empty(0, dtype=np.int32)
+        return {"Usuario Id": np.empty(0, dtype=np.int64), "Viajes": vacio, "Días activos": vacio,
+                "Viajes encadenados": vacio, "Año de nacimiento": np.empty(0, dtype=np.float32),
+                "Primer viaje": np.empty(0, dtype="datetime64[s]"),
+                "Último viaje": np.empty(0, dtype="datetime64[s]")}, np.zeros(len(ETIQUETAS_COHORTE), dtype=np.int64)
+
+    usuarios = usuarios[orden]
+    inicio = inicio[orden]
+    ticks_inicio = inicio.view(np.int64)
+    ticks_fin = df["Fin del viaje"].to_numpy()[orden].view(np.int64)
+    origen = df["Origen Id"].to_numpy()[orden]
+    destino = df["Destino Id"].to_numpy()[orden]
+
+    # 🔹 **Límites de cada usuario en el arreglo ordenado**
+    nuevo_usuario = np.ones(n, dtype=bool)
+    nuevo_usuario[1:] = usuarios[1:] != usuarios[:-1]
+    inicios_grupo = np.flatnonzero(nuevo_usuario)
+    codigo_usuario = np.cumsum(nuevo_usuario, dtype=np.int32) - 1
+    num_usuarios = len(inicios_grupo)
+
+    # 🔹 **Viajes encadenados (comparación con el viaje anterior desplazado)**
+    espera = ticks_inicio[1:] - ticks_fin[:-1]
+    encadenado = np.zeros(n, dtype=bool)
+    encadenado[1:] = (~nuevo_usuario[1:] & (origen[1:] == destino[:-1])
+                      & (espera >= 0) & (espera <= ventana_min * 60 * por_segundo))
+
+    # 🔹 **Días activos: cambios de día dentro del mismo usuario**
+    dia = ticks_inicio // (86400 * por_segundo)
+    nuevo_dia = nuevo_usuario.copy()
+    nuevo_dia[1:] |= dia[1:] != dia[:-1]
+
+    # 🔹 **Año de nacimiento por usuario (opcional en los datos de origen)**
+    if "Año de nacimiento" in df.columns:
+        nacimiento = np.fmax.reduceat(df["Año de nacimiento"].to_numpy(dtype=np.float32)[orden], inicios_grupo)
+    else:
+        nacimiento = np.full(num_usuarios, np.nan, dtype=np.float32)
+
+    resumen = {
+        "Usuario Id": usuarios[inicios_grupo].astype(np.int64),
+        "Viajes": np.diff(np.append(inicios_grupo, n)).astype(np.int32),
+        "Días activos": np.bincount(codigo_usuario, weights=nuevo_dia, minlength=num_usuarios).astype(np.int32),
+        "Viajes encadenados": np.bincount(codigo_usuario, weights=encadenado, minlength=num_usuarios).astype(np.int32),
+        "Año de nacimiento": nacimiento,
+        "Primer viaje": inicio[inicios_grupo].astype("datetime64[s]"),
+        "Último viaje": inicio[np.append(inicios_grupo[1:], n) - 1].astype("datetime64[s]"),
+    }
+
+    # 🔹 **Viajes por cohorte de edad (edad al primer viaje)**
+    año_primer_viaje = resumen["Primer viaje"].astype("datetime64[Y]").astype(np.int64) + 1970
+    edad = año_primer_viaje - resumen["Año de nacimiento"]
+    con_edad = ~np.isnan(edad) & (edad >= 0)
+    cohorte = np.digitize(edad[con_edad], COHORTES_EDAD) - 1
+    viajes_por_cohorte = np.bincount(cohorte, weights=resumen["Viajes"][con_edad],
+                                     minlength=len(ETIQUETAS_COHORTE))[:len(ETIQUETAS_COHORTE)].astype(np.int64)
+
+    return resumen, viajes_por_cohorte
+
+@st.cache_data(max_entries=4)
+def sesionizar_seleccion(clave, año, meses, estaciones, ventana_min):
+    """
+    Sesionización cacheada con claves baratas (almacén, filtros y ventana) en lugar del DataFrame,
+    para que cambiar otros controles no vuelva a ordenar toda la selección.
+    """
+    return sesionizar_usuarios(
+        leer_seleccion(["Usuario Id", "Año de nacimiento", "Inicio del viaje", "Fin del viaje",
+                        "Origen Id", "Destino Id"], año, meses, estaciones),
+        ventana_min)
+
+# -----------------------------------------
+# 👤 Análisis de Usuarios
+# -----------------------------------------
+st.subheader("👤 **Análisis por Usuario**")
+
+ventana_encadenado = st.sidebar.slider("⛓️ Ventana para viajes encadenados (min)", 5, 120, 30, step=5)
+resumen_usuarios, viajes_por_cohorte = sesionizar_seleccion(
+    clave_datos, seleccion_año, rango_meses, tuple(seleccion_estaciones), ventana_encadenado)
+
+if len(resumen_usuarios["Usuario Id"]) > 0:
+    total_viajes_usuarios = resumen_usuarios["Viajes"].sum()
+    st.write(f"👥 **Usuarios distintos:** {len(resumen_usuarios['Usuario Id']):,}")
+    st.write(f"🚲 **Viajes promedio por usuario:** {resumen_usuarios['Viajes'].mean():.2f}")
+    st.write(f"📆 **Días activos promedio por usuario:** {resumen_usuarios['Días activos'].mean():.2f}")
+    st.write(f"⛓️ **Viajes encadenados:** {resumen_usuarios['Viajes encadenados'].sum():,} "
+             f"({resumen_usuarios['Viajes encadenados'].sum() / total_viajes_usuarios:.1%} del total)")
+
+    # 🔹 **Distribución de viajes por usuario**
+    fig, ax = plt.subplots(figsize=(12, 6))
+    sns.histplot(resumen_usuarios["Viajes"], bins=50, log_scale=(False, True), color="teal", ax=ax)
+    ax.set_xlabel("Viajes por Usuario")
+    ax.set_ylabel("Número de Usuarios")
+    ax.set_title("Distribución de Viajes por Usuario")
+    st.pyplot(fig)
+
+    # 🔹 **Uso por cohorte de edad**
+    fig, ax = plt.subplots(figsize=(12, 6))
+    sns.barplot(x=ETIQUETAS_COHORTE, y=viajes_por_cohorte, palette="viridis", ax=ax)
+    ax.set_xlabel("Cohorte de Edad")
+    ax.set_ylabel("Número de Viajes")
+    ax.set_title("Viajes por Cohorte de Edad")
     st.pyplot(fig)
-    st.text("📊 Este análisis examina la relación entre el día de la semana y la duración de los viajes en Mibici. "
-        "Se calcula el coeficiente de correlación de Pearson para evaluar si existe una tendencia en la duración "
-        "de los viajes según el día. Además, se presenta un gráfico de caja (boxplot) para visualizar la distribución "
-        "de los tiempos de viaje en cada día de la semana, permitiendo identificar patrones o diferencias significativas "
-        "en el uso de Mibici a lo largo de la semana. 🚴‍♂️📅")
 
+    # 🔹 **Top 10 usuarios más activos**
+    top_usuarios = np.argsort(resumen_usuarios["Viajes"])[::-1][:10]
+    st.write("🏅 **Top 10 Usuarios con Más Viajes**")
+    st.dataframe(pd.DataFrame({col: valores[top_usuarios] for col, valores in resumen_usuarios.items()}))
+    st.text("👤 Esta sección analiza el comportamiento individual de los usuarios de Mibici. "
+            "Se calcula el número de viajes y de días activos de cada usuario, así como los viajes encadenados, "
+            "es decir, aquellos que inician en la estación donde terminó el viaje anterior del mismo usuario "
+            "dentro de la ventana de tiempo seleccionada. También se muestra el uso por cohorte de edad, "
+            "calculada con el año de nacimiento y el año del primer viaje. 🚴‍♂️📊")
 else:
-    st.error("⚠️ No se encontraron las columnas necesarias ('Inicio del viaje' y 'Duración (min)').")
+    st.warning("⚠️ No hay viajes con usuario válido para el análisis por usuario.")